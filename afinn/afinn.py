@@ -3,13 +3,20 @@
 
 from __future__ import absolute_import, division, print_function
 
-import codecs
+import io
 
 import re
 
+from bisect import bisect_left
+
+from collections import OrderedDict
+
 from os.path import dirname, join
 
 
+# Directory with the sentiment wordlists
+DATA_DIR = join(dirname(__file__), 'data')
+
 LANGUAGE_TO_FILENAME = {
     'da': 'AFINN-da-32.txt',
     'en': 'AFINN-en-165.txt',
@@ -21,6 +28,178 @@ LANGUAGE_TO_FILENAME = {
     'tr': 'AFINN-tr-165.txt',
     }
 
+# Characters with special meaning in regular expressions outside a character
+# set, and the translation table escaping them
+REGEX_SPECIAL_CHARACTERS = frozenset('.^$*+?{}[]()|\\')
+REGEX_ESCAPE_TABLE = dict((ord(char), '\\' + char)
+                          for char in REGEX_SPECIAL_CHARACTERS)
+
+# Last Unicode character. No character follows it in the sorted order.
+MAX_UNICODE_CHARACTER = chr(0x10FFFF)
+
+# Maximum nesting of groups in a trie-structured regular expression before
+# regex_from_tokens uses a plain alternation of the tokens instead
+MAX_REGEX_NESTING = 100
+
+# Pattern for splitting a text into words. It is the same for all instances.
+WORD_PATTERN = re.compile(r'\w+', flags=re.UNICODE)
+
+# Scores in the word files as strings and as integers. All AFINN scores are
+# in this range, so the integer conversion is usually a dictionary lookup.
+SCORE_STRING_TO_INT = dict((str(score), score) for score in range(-5, 6))
+
+# Maximum number of entries in the setup cache. The bundled word files give
+# at most about 20 entries.
+SETUP_CACHE_SIZE = 32
+
+# Word dictionaries and compiled patterns set up from data files, keyed by
+# the filenames and the word boundary flag. Each entry holds the contents of
+# the files it was set up from, so a changed file is set up again and replaces
+# the entry. Only the dictionaries and patterns are shared between Afinn
+# instances, as an instance may be set up again with setup_from_file. The
+# least recently used entry is dropped when the cache is full.
+_SETUP_CACHE = OrderedDict()
+
+
+def _file_content(filename):
+    """Return content of a file as bytes."""
+    with io.open(filename, 'rb') as fid:
+        return fid.read()
+
+
+def _escape(string):
+    """Escape characters with a special meaning in a regular expression.
+
+    Unlike re.escape, only the few special characters are escaped, so the
+    letters that tokens mostly consist of are returned as they are.
+
+    """
+    return string.translate(REGEX_ESCAPE_TABLE)
+
+
+def _regex_from_sorted_tokens(tokens):
+    """Return regular expression alternation string from sorted tokens.
+
+    The tokens are factored as a trie: Tokens sharing a prefix are grouped
+    after the prefix, and single characters ending tokens are collected in a
+    character set. The trie is not built but walked in the sorted tokens,
+    where the tokens with a common prefix form a range. No recursion is used,
+    so tokens with many nested prefixes do not exceed the recursion limit.
+
+    Parameters
+    ----------
+    tokens : list of str
+        Sorted list of distinct and non-empty tokens.
+
+    Returns
+    -------
+    regex : str
+        String with alternation of the tokens
+    nesting : int
+        Maximum nesting of groups in the regular expression
+
+    """
+    if not tokens:
+        return '', 0
+
+    # Most word lists have no special characters to escape
+    if REGEX_SPECIAL_CHARACTERS.isdisjoint(set(''.join(tokens))):
+        escape = str
+    else:
+        escape = _escape
+
+    # Ranges of tokens with a common prefix, given by the start and end index
+    # in the tokens, the length of the prefix and the nesting of the range. A
+    # range is appended after the range it is part of, so the loop also visits
+    # the appended ranges.
+    ranges = [(0, len(tokens), 0, 0)]
+    branches = []
+    nesting = 0
+    for lo, hi, depth, level in ranges:
+        level += 1
+        # Only the first token in the range can be the prefix itself
+        end = len(tokens[lo]) == depth
+        chains = []
+        endings = []
+        n = lo + 1 if end else lo
+        while n < hi:
+            token = tokens[n]
+            char = token[depth]
+            if n + 1 == hi or tokens[n + 1][depth] != char:
+                # The only token with this character ends with it or gives a
+                # chain of characters
+                if len(token) == depth + 1:
+                    endings.append(char)
+                else:
+                    chains.append((escape(token[depth:]), None))
+                n += 1
+                continue
+
+            # Range of tokens with this character followed by the chain of
+            # characters common to the tokens
+            if char == MAX_UNICODE_CHARACTER:
+                stop = hi
+            else:
+                stop = bisect_left(
+                    tokens, token[:depth] + chr(ord(char) + 1), n + 2, hi)
+            last = tokens[stop - 1]
+            size = min(len(token), len(last))
+            length = depth + 1
+            while length < size and token[length] == last[length]:
+                length += 1
+            chains.append((escape(token[depth:length]), len(ranges)))
+            ranges.append((n, stop, length, level))
+            n = stop
+        if chains and level > nesting:
+            nesting = level
+        branches.append((end, chains, endings))
+
+    # Regular expressions of the ranges are built from the last range, so
+    # the regular expressions of the ranges in a range are ready
+    regexes = [None] * len(ranges)
+    for index in range(len(ranges) - 1, -1, -1):
+        end, chains, endings = branches[index]
+        alternatives = [chain if subrange is None
+                        else chain + regexes[subrange]
+                        for chain, subrange in chains]
+        if len(endings) == 1:
+            alternatives.append(escape(endings[0]))
+        elif endings:
+            # Characters such as '-', '^' and ']' are special in a character
+            # set
+            alternatives.append('[' + ''.join(map(re.escape, endings)) + ']')
+        regex = '|'.join(alternatives)
+
+        # Group the regular expression for appending to the chain of the
+        # common prefix. Only single-character endings give a character or a
+        # character set. The first range has no common prefix and no token
+        # equal to the empty prefix.
+        if end:
+            # Greedy optional: The longest token is tried first
+            if chains:
+                regex = '(?:' + regex + ')?'
+            else:
+                regex += '?'
+        elif chains and len(alternatives) > 1 and index:
+            regex = '(?:' + regex + ')'
+        regexes[index] = regex
+    return regexes[0], nesting
+
+
+# Sentiment analyzer set up once in each worker process of score_parallel
+_worker_afinn = None
+
+
+def _init_worker(afinn):
+    """Set sentiment analyzer for the worker process."""
+    global _worker_afinn
+    _worker_afinn = afinn
+
+
+def _score_batch_in_worker(texts):
+    """Score texts with the sentiment analyzer of the worker process."""
+    return _worker_afinn.score_batch(texts)
+
 
 class AfinnException(Exception):
     """Base for exceptions raised in this module."""
@@ -59,6 +238,22 @@ class Afinn(object):
 
     """
 
+    __slots__ = ('_dict', '_pattern', '__weakref__')
+
+    def __getstate__(self):
+        """Return state for pickling as dictionary of attributes."""
+        return {'_dict': self._dict, '_pattern': self._pattern}
+
+    def __setstate__(self, state):
+        """Set state from unpickled dictionary of attributes.
+
+        Pickles from versions without slots hold further attributes, such as
+        the word splitting pattern. These are ignored.
+
+        """
+        self._dict = state['_dict']
+        self._pattern = state['_pattern']
+
     def __init__(self, language="en", emoticons=False, word_boundary=True):
         """Set up dictionary from data file.
 
@@ -77,30 +272,15 @@ class Afinn(object):
         filename = LANGUAGE_TO_FILENAME[language]
         full_filename = self.full_filename(filename)
         if emoticons:
-            # Words
-            self._dict = self.read_word_file(full_filename)
-            regex_words = self.regex_from_tokens(
-                list(self._dict),
-                word_boundary=True, capture=False)
-
-            # Emoticons
             filename_emoticons = LANGUAGE_TO_FILENAME['emoticons']
             full_filename_emoticons = self.full_filename(filename_emoticons)
-            emoticons_and_score = self.read_word_file(full_filename_emoticons)
-            self._dict.update(emoticons_and_score)
-            regex_emoticons = self.regex_from_tokens(
-                list(emoticons_and_score), word_boundary=False,
-                capture=False)
-
-            # Combined words and emoticon regular expression
-            regex = '(' + regex_words + '|' + regex_emoticons + ')'
-            self._setup_pattern_from_regex(regex)
-
+            filenames = (full_filename, full_filename_emoticons)
+            self._setup_cached(
+                filenames, filenames,
+                lambda: self._setup_from_words_and_emoticons(*filenames))
         else:
             self.setup_from_file(full_filename, word_boundary=word_boundary)
 
-        self._word_pattern = re.compile(r'\w+', flags=re.UNICODE)
-
     def data_dir(self):
         """Return directory where the text files are.
 
@@ -121,7 +301,7 @@ class Afinn(object):
         'data'
 
         """
-        return join(dirname(__file__), 'data')
+        return DATA_DIR
 
     def full_filename(self, filename):
         """Return filename with full with data directory.
@@ -153,16 +333,81 @@ class Afinn(object):
         """Set up data from data file.
 
         Read the word file and setup the regular expression pattern for
-        matching.
+        matching. The result is cached, so setting up again from a file with
+        unchanged content only reads the file and neither parses it nor builds
+        the pattern.
 
         Parameters
         ----------
         filename : str
             Full filename.
+        word_boundary : bool, optional
+            Use word boundary match in the regular expression.
 
         """
+        def setup():
+            self._dict = self.read_word_file(filename)
+            self._setup_pattern_from_dict(word_boundary=word_boundary)
+
+        self._setup_cached((filename, word_boundary), (filename,), setup)
+
+    def _setup_from_words_and_emoticons(self, filename, filename_emoticons):
+        """Set up data from word file and emoticon file.
+
+        Parameters
+        ----------
+        filename : str
+            Full filename of word file.
+        filename_emoticons : str
+            Full filename of emoticon file.
+
+        """
+        # Words
         self._dict = self.read_word_file(filename)
-        self._setup_pattern_from_dict(word_boundary=word_boundary)
+        regex_words = self.regex_from_tokens(
+            list(self._dict),
+            word_boundary=True, capture=False)
+
+        # Emoticons
+        emoticons_and_score = self.read_word_file(filename_emoticons)
+        self._dict.update(emoticons_and_score)
+        regex_emoticons = self.regex_from_tokens(
+            list(emoticons_and_score), word_boundary=False,
+            capture=False)
+
+        # Combined words and emoticon regular expression
+        regex = '(' + regex_words + '|' + regex_emoticons + ')'
+        self._setup_pattern_from_regex(regex)
+
+    def _setup_cached(self, key, filenames, setup):
+        """Set up data with the setup cache.
+
+        The dictionary and pattern are taken from the cache if the files have
+        the same contents as when the cache entry was set up. Otherwise they
+        are set up and replace the cache entry.
+
+        Parameters
+        ----------
+        key : tuple
+            Key for the entry in the setup cache.
+        filenames : tuple of str
+            Full filenames of the files the data is set up from.
+        setup : callable
+            Function without arguments setting up the data from the files.
+
+        """
+        contents = tuple(map(_file_content, filenames))
+        cached = _SETUP_CACHE.get(key)
+        if cached is not None and cached[0] == contents:
+            _, self._dict, self._pattern = cached
+            _SETUP_CACHE.move_to_end(key)
+            return
+
+        setup()
+        _SETUP_CACHE[key] = contents, self._dict, self._pattern
+        _SETUP_CACHE.move_to_end(key)
+        while len(_SETUP_CACHE) > SETUP_CACHE_SIZE:
+            _SETUP_CACHE.popitem(last=False)
 
     @staticmethod
     def read_word_file(filename):
@@ -180,13 +425,19 @@ class Afinn(object):
 
         """
         word_dict = {}
-        with codecs.open(filename, encoding='UTF-8') as fid:
-            for n, line in enumerate(fid):
-                try:
-                    word, score = line.strip().split('\t')
-                except ValueError:
-                    msg = 'Error in line %d of %s' % (n + 1, filename)
-                    raise WordListReadingError(msg)
+        # Reading and decoding the whole file at once is faster than line
+        # iteration over a decoding stream reader
+        with io.open(filename, 'rb') as fid:
+            lines = fid.read().decode('UTF-8').splitlines()
+        for n, line in enumerate(lines):
+            try:
+                word, score = line.strip().split('\t')
+            except ValueError:
+                msg = 'Error in line %d of %s' % (n + 1, filename)
+                raise WordListReadingError(msg)
+            if score in SCORE_STRING_TO_INT:
+                word_dict[word] = SCORE_STRING_TO_INT[score]
+            else:
                 word_dict[word] = int(score)
         return word_dict
 
@@ -212,23 +463,28 @@ class Afinn(object):
         --------
         >>> afinn = Afinn()
         >>> afinn.regex_from_tokens(['good', 'bad'])
-        '(\\b(?:good|bad)\\b)'
+        '(\\b(?:bad|good)\\b)'
 
         >>> afinn.regex_from_tokens(['good', 'bad'], word_boundary=False,
         ...     capture=False)
-        '(?:good|bad)'
-
-        """
-        tokens_ = tokens[:]
-
-        # The longest tokens are first in the list
-        tokens_.sort(key=lambda word: len(word), reverse=True)
+        '(?:bad|good)'
 
-        # Some tokens might contain parentheses or other problematic characters
-        tokens_ = [re.escape(word) for word in tokens_]
+        >>> afinn.regex_from_tokens(['bad', 'badly', 'badness'],
+        ...     word_boundary=False, capture=False)
+        '(?:bad(?:ly|ness)?)'
 
-        # Build regular expression
-        regex = '(?:' + "|".join(tokens_) + ')'
+        """
+        # Factor the tokens as a trie so the regular expression engine
+        # descends character by character instead of trying every token at
+        # every position. The longest token is still matched first.
+        regex, nesting = _regex_from_sorted_tokens(
+            sorted(set(tokens) - set([''])))
+        if nesting > MAX_REGEX_NESTING:
+            # The parser of the re module recurses into nested groups, so
+            # fall back to a plain alternation with the longest tokens first
+            tokens_ = sorted(tokens, key=len, reverse=True)
+            regex = '|'.join(map(re.escape, tokens_))
+        regex = '(?:' + regex + ')'
         if word_boundary:
             regex = r"\b" + regex + r"\b"
         if capture:
@@ -289,8 +545,13 @@ class Afinn(object):
         ['wonderful', ':)']
 
         """
+        if text == '':
+            return []
         if clean_whitespace:
-            text = re.sub(r"\s+", " ", text)
+            # str.split and the regular expression '\s' agree on whitespace.
+            # Leading and trailing whitespace cannot be part of a match. As
+            # with re.sub, text that is not a string raises a TypeError.
+            text = ' '.join(str.split(text))
         words = self._pattern.findall(text.lower())
         return words
 
@@ -314,7 +575,7 @@ class Afinn(object):
         ['Hello', 'world']
 
         """
-        wordlist = self._word_pattern.findall(text)
+        wordlist = WORD_PATTERN.findall(text)
         return wordlist
 
     def score_with_pattern(self, text):
@@ -337,8 +598,39 @@ class Afinn(object):
             Sentiment analysis score for text
 
         """
-        word_scores = self.scores_with_pattern(text)
-        score = float(sum(word_scores))
+        if text == '':
+            return 0.0
+        score = float(self.score_int(text))
+        return score
+
+    def score_int(self, text):
+        """Score text based on pattern matching as an integer.
+
+        This is the same as `score_with_pattern` except that the score is
+        returned as the integer sum of the word scores, without conversion to
+        float.
+
+        Parameters
+        ----------
+        text : str
+            Text to be analyzed for sentiment.
+
+        Returns
+        -------
+        score : int
+            Sentiment analysis score for text
+
+        Examples
+        --------
+        >>> afinn = Afinn()
+        >>> afinn.score_int('This is utterly excellent!')
+        3
+
+        """
+        if text == '':
+            return 0
+        words = self.find_all(text)
+        score = sum(map(self._dict.__getitem__, words))
         return score
 
     def scores_with_pattern(self, text):
@@ -372,7 +664,73 @@ class Afinn(object):
         """
         # TODO: ":D" is not matched
         words = self.find_all(text)
-        scores = [self._dict[word] for word in words]
+        scores = list(map(self._dict.__getitem__, words))
+        return scores
+
+    def score_batch(self, texts):
+        """Score multiple texts based on pattern matching.
+
+        The scores are the same as from `score_with_pattern` on each of the
+        texts, but the pattern and dictionary lookups are only resolved once
+        for the whole batch.
+
+        Parameters
+        ----------
+        texts : list of str
+            Texts to be analyzed for sentiment.
+
+        Returns
+        -------
+        scores : list of floats
+            Sentiment analysis score for each text
+
+        Examples
+        --------
+        >>> afinn = Afinn()
+        >>> afinn.score_batch(['Good and bad', 'It is good', ''])
+        [0.0, 3.0, 0.0]
+
+        """
+        find_all = self.find_all
+        lookup = self._dict.__getitem__
+        scores = [float(sum(map(lookup, find_all(text)))) for text in texts]
+        return scores
+
+    def score_parallel(self, texts, workers=None):
+        """Score multiple texts in parallel processes.
+
+        The texts are split in chunks that are scored with `score_batch` in a
+        pool of worker processes. The sentiment analyzer is sent once to each
+        worker when the pool starts, so its dictionary and pattern are neither
+        set up from the data file nor sent along with every chunk.
+
+        Parameters
+        ----------
+        texts : list of str
+            Texts to be analyzed for sentiment.
+        workers : int, optional
+            Number of worker processes. Default is the number of processors.
+
+        Returns
+        -------
+        scores : list of floats
+            Sentiment analysis score for each text
+
+        """
+        from multiprocessing import Pool, cpu_count
+
+        texts = list(texts)
+        if workers is None:
+            workers = cpu_count()
+        chunk_size = max(1, len(texts) // (4 * workers))
+        chunks = [texts[n:n + chunk_size]
+                  for n in range(0, len(texts), chunk_size)]
+
+        with Pool(workers, _init_worker, (self,)) as pool:
+            scores = [score
+                      for chunk_scores in pool.map(
+                          _score_batch_in_worker, chunks)
+                      for score in chunk_scores]
         return scores
 
     def score_with_wordlist(self, text):
@@ -391,8 +749,11 @@ class Afinn(object):
             Sentiment analysis score for text
 
         """
+        if text == '':
+            return 0.0
         words = self.split(text)
-        word_scores = (self._dict.get(word.lower(), 0.0) for word in words)
+        word_dict = self._dict
+        word_scores = [word_dict.get(word.lower(), 0) for word in words]
         score = float(sum(word_scores))
         return score
 
@@ -16,8 +16,6 @@ setup(
     package_data={'afinn': ['data/*.txt', 'data/LICENSE']},
     long_description='',
     classifiers=[
-        'Programming Language :: Python :: 2.6',
-        'Programming Language :: Python :: 2.7',
         'Programming Language :: Python :: 3.3',
         'Programming Language :: Python :: 3.4',
         'Programming Language :: Python :: 3.5',
@@ -2,22 +2,46 @@
 """Test of afinn."""
 
 
+import csv
+
 import io
 
-import sys
+import os
+
+import pickle
+
+import re
+
+import weakref
+
+from glob import glob
 
-from os import listdir
 from os.path import join
 
+import pytest
+
 from afinn import Afinn
+from afinn.afinn import (_SETUP_CACHE, SETUP_CACHE_SIZE,
+                         WordListReadingError)
+
+
+@pytest.fixture(scope="module")
+def afinn_en():
+    """Return English sentiment analyzer shared by the tests."""
+    return Afinn()
+
+
+@pytest.fixture(scope="session")
+def afinn_by_language():
+    """Return function giving a sentiment analyzer shared for a language."""
+    afinns = {}
 
+    def get(language):
+        if language not in afinns:
+            afinns[language] = Afinn(language=language)
+        return afinns[language]
 
-# https://stackoverflow.com/questions/6625782
-if sys.version_info[0] == 2:
-    import codecs
-    u = lambda s: codecs.unicode_escape_decode(s)[0]
-elif sys.version_info[0] == 3:
-    u = lambda s: s
+    return get
 
 
 def test_afinn():
@@ -25,114 +49,132 @@ def test_afinn():
     assert isinstance(afinn, Afinn)
 
 
-def test_find_all():
-    afinn = Afinn()
-    words = afinn.find_all("It is so bad")
-    assert words == ['bad']
-
+def test_pickle(afinn_en):
+    for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+        afinn = pickle.loads(pickle.dumps(afinn_en, protocol=protocol))
+        assert afinn.score('bad') == afinn_en.score('bad')
 
-def test_split():
-    afinn = Afinn()
-    words = afinn.split('Hello, World')
-    assert words == ['Hello', 'World']
 
-    words = afinn.split(u('Hell\xf8, \xc5rld'))
-    assert words == [u('Hell\xf8'), u('\xc5rld')]
+def test_pickle_state_with_word_pattern():
+    # State of instances pickled before Afinn had slots
+    state = {'_dict': {'bad': -3}, '_pattern': re.compile(r'(\bbad\b)'),
+             '_word_pattern': re.compile(r'\w+', flags=re.UNICODE)}
+    afinn = Afinn.__new__(Afinn)
+    afinn.__setstate__(state)
+    assert afinn.score('It is bad') == -3
 
 
-def test_score():
-    afinn = Afinn()
-    score = afinn.score('bad')
-    assert score < 0
+def test_weakref(afinn_en):
+    assert weakref.ref(afinn_en)() is afinn_en
 
-    score = afinn.score('')
-    assert score == 0.0
 
+def test_find_all(afinn_en):
+    words = afinn_en.find_all("It is so bad")
+    assert words == ['bad']
 
-def test_score_language():
-    afinn = Afinn(language='en')
-    score = afinn.score('bad')
-    assert score < 0
 
-    afinn = Afinn('en')
-    score = afinn.score('bad')
-    assert score < 0
+def test_find_all_not_string(afinn_en):
+    with pytest.raises(TypeError):
+        afinn_en.find_all(b'It is so bad')
 
 
-def test_unicode():
-    afinn = Afinn()
-    score = afinn.score(u('na\xefve'))
-    assert score < 0
+def test_find_all_longest_match(afinn_en, afinn_by_language):
+    afinn = afinn_by_language('da')
+    words = afinn.find_all('Det er godt og ikke god')
+    assert words == ['godt', 'ikke god']
 
+    words = afinn_en.find_all('Goodness, it went badly, bad and good')
+    assert words == ['goodness', 'badly', 'bad', 'good']
 
-def test_danish():
-    afinn = Afinn(language='da')
-    score = afinn.score('bedrageri')
-    assert score < 0
 
-    score = afinn.score(u('besv\xe6r'))
-    assert score < 0
+def test_regex_from_tokens_nested_prefixes():
+    tokens = ['a' * n for n in range(1, 600)]
+    regex = Afinn.regex_from_tokens(tokens)
+    words = re.findall(regex, 'b aaa ' + 'a' * 599)
+    assert words == ['aaa', 'a' * 599]
 
-    score = afinn.score(u('D\xc5RLIG!!!'))
-    assert score < 0
 
+def test_split(afinn_en):
+    words = afinn_en.split('Hello, World')
+    assert words == ['Hello', 'World']
 
-def test_finnish():
-    afinn = Afinn(language='fi')
-    score = afinn.score('juttu, katsokaa ja kuunnelkaa.')
-    assert score == 0
+    words = afinn_en.split('Hell\xf8, \xc5rld')
+    assert words == ['Hell\xf8', '\xc5rld']
 
 
-def test_french():
-    afinn = Afinn(language='fr')
-    score = afinn.score('accidentelle')
+def test_score(afinn_en):
+    score = afinn_en.score('bad')
     assert score < 0
 
-    score = afinn.score(u('accus\xe9'))
-    assert score < 0
+    score = afinn_en.score('')
+    assert score == 0.0
 
-    score = afinn.score(u('sans charme'))
-    assert score < 0
 
+def test_score_int(afinn_en):
+    score = afinn_en.score_int('bad')
+    assert score == -3
+    assert isinstance(score, int)
 
-def test_polish():
-    afinn = Afinn(language='pl')
-    score = afinn.score('kurwa')
-    assert score < 0
+    assert afinn_en.score_int('') == 0
 
-    score = afinn.score('ambitny')
-    assert score > 0
 
-    score = afinn.score(u('arcydzie\u0142o'))
-    assert score > 0
+def test_score_batch(afinn_by_language):
+    afinn = afinn_by_language('da')
+    texts = ['ikke god', 'ikke   god', 'En tv-succes sidste gang.', '']
+    scores = afinn.score_batch(texts)
+    assert scores == [afinn.score(text) for text in texts]
 
+    assert afinn.score_batch([]) == []
 
-def test_swedish():
-    afinn = Afinn(language='sv')
-    score = afinn.score('befrias')
-    assert score > 0
 
-    score = afinn.score(u('utm\xe4rkelse'))
-    assert score > 0
+def test_score_parallel(afinn_en):
+    texts = ['Good and bad', 'It is good', '', 'bad bad'] * 10
+    scores = afinn_en.score_parallel(texts, workers=2)
+    assert scores == afinn_en.score_batch(texts)
 
-    score = afinn.score(u('ett snyggt'))
-    assert score > 0
+    assert afinn_en.score_parallel([], workers=2) == []
 
 
-def test_turkish():
-    afinn = Afinn(language='tr')
-    score = afinn.score('kar')
-    assert score > 0
+def test_score_language():
+    afinn = Afinn(language='en')
+    score = afinn.score('bad')
+    assert score < 0
+
+    afinn = Afinn('en')
+    score = afinn.score('bad')
+    assert score < 0
 
-    score = afinn.score(u('\xe7ok iyi'))
-    assert score > 0
 
-    score = afinn.score(u('\xe7ok k\xf6t\xfc'))
+def test_unicode(afinn_en):
+    score = afinn_en.score('na\xefve')
     assert score < 0
 
 
-def test_score_with_pattern():
-    afinn = Afinn(language='da')
+@pytest.mark.parametrize('language,text,sign', [
+    ('da', 'bedrageri', -1),
+    ('da', 'besv\xe6r', -1),
+    ('da', 'D\xc5RLIG!!!', -1),
+    ('fi', 'juttu, katsokaa ja kuunnelkaa.', 0),
+    ('fr', 'accidentelle', -1),
+    ('fr', 'accus\xe9', -1),
+    ('fr', 'sans charme', -1),
+    ('pl', 'kurwa', -1),
+    ('pl', 'ambitny', 1),
+    ('pl', 'arcydzie\u0142o', 1),
+    ('sv', 'befrias', 1),
+    ('sv', 'utm\xe4rkelse', 1),
+    ('sv', 'ett snyggt', 1),
+    ('tr', 'kar', 1),
+    ('tr', '\xe7ok iyi', 1),
+    ('tr', '\xe7ok k\xf6t\xfc', -1),
+])
+def test_languages(afinn_by_language, language, text, sign):
+    score = afinn_by_language(language).score(text)
+    assert (score > 0) - (score < 0) == sign
+
+
+def test_score_with_pattern(afinn_by_language):
+    afinn = afinn_by_language('da')
     score = afinn.score('ikke god')
     assert score < 0
 
@@ -152,38 +194,103 @@ def test_score_with_pattern():
     assert score == 0.0
 
 
-def test_score_with_wordlist():
-    afinn = Afinn()
-    score = afinn.score_with_wordlist('Rather good.')
+def test_score_with_wordlist(afinn_en):
+    score = afinn_en.score_with_wordlist('Rather good.')
     assert score > 0
 
-    score = afinn.score_with_wordlist('Rather GOOD.')
+    score = afinn_en.score_with_wordlist('Rather GOOD.')
     assert score > 0
 
 
-def test_score_with_wordlist_empty():
-    afinn = Afinn()
-    score = afinn.score_with_wordlist('')
+def test_score_with_wordlist_empty(afinn_en):
+    score = afinn_en.score_with_wordlist('')
     assert score == 0.0
 
 
-def test_data():
+@pytest.mark.parametrize("text", [None, 0, [], b''])
+def test_score_not_string(afinn_en, text):
+    with pytest.raises(TypeError):
+        afinn_en.score(text)
+    with pytest.raises(TypeError):
+        afinn_en.score_with_wordlist(text)
+    with pytest.raises(TypeError):
+        afinn_en.find_all(text)
+
+
+def test_data(afinn_en):
     """Test data files for format."""
-    afinn = Afinn()
-    filenames = listdir(afinn.data_dir())
-    for filename in filenames:
-        if not filename.endswith('.txt'):
-            continue
-        full_filename = join(afinn.data_dir(), filename)
-        with io.open(full_filename, encoding='UTF-8') as fid:
-            for line in fid:
+    data_dir = afinn_en.data_dir()
+    full_filenames = glob(join(data_dir, '*.txt'))
+    assert full_filenames
+    for full_filename in full_filenames:
+        with io.open(full_filename, encoding='UTF-8', newline='') as fid:
+            reader = csv.reader(fid, delimiter='\t', quoting=csv.QUOTE_NONE)
+            for row in reader:
                 # There should be the phrase and the score
                 # and nothing more
-                assert len(line.split('\t')) == 2
+                assert len(row) == 2, row
+
+                # The score should be an integer: digits with an optional
+                # minus sign
+                phrase, score = row
+                if score.startswith('-'):
+                    score = score[1:]
+                assert score.isdecimal(), row
+
+
+def test_read_word_file(tmpdir):
+    filename = str(tmpdir.join('wordlist.txt'))
+    with io.open(filename, 'w', encoding='UTF-8') as fid:
+        fid.write('good\t2\nsuperb\t10\nbad\t-3\n')
+    word_dict = Afinn.read_word_file(filename)
+    assert word_dict == {'good': 2, 'superb': 10, 'bad': -3}
+
+    with io.open(filename, 'w', encoding='UTF-8') as fid:
+        fid.write('good\t2\nbad -3\n')
+    with pytest.raises(WordListReadingError):
+        Afinn.read_word_file(filename)
+
+
+def test_setup_from_file_cache(tmpdir):
+    filename = str(tmpdir.join('wordlist.txt'))
+    with io.open(filename, 'w', encoding='UTF-8') as fid:
+        fid.write('good\t2\n')
+
+    afinn = Afinn()
+    afinn.setup_from_file(filename)
+    assert afinn.score('good') == 2
+
+    other = Afinn()
+    other.setup_from_file(filename)
+    assert other._pattern is afinn._pattern
+
+    # A changed file is read again, also when its modification time is kept
+    stat = os.stat(filename)
+    with io.open(filename, 'w', encoding='UTF-8') as fid:
+        fid.write('good\t-4\n')
+    os.utime(filename, (stat.st_atime, stat.st_mtime))
+    afinn = Afinn()
+    afinn.setup_from_file(filename)
+    assert afinn.score('good') == -4
 
-                # The score should be interpretable as an int
-                phrase, score = line.split('\t')
-                assert type(int(score)) == int
+    # The changed file replaces the cache entry for the file
+    entries = [key for key in _SETUP_CACHE if key[0] == filename]
+    assert entries == [(filename, True)]
+
+
+def test_setup_cache_size(tmpdir):
+    filenames = []
+    for n in range(SETUP_CACHE_SIZE + 1):
+        filename = str(tmpdir.join('wordlist%d.txt' % n))
+        with io.open(filename, 'w', encoding='UTF-8') as fid:
+            fid.write('good\t%d\n' % (n % 5))
+        Afinn().setup_from_file(filename)
+        filenames.append(filename)
+
+    # The least recently used entry is dropped
+    assert len(_SETUP_CACHE) == SETUP_CACHE_SIZE
+    assert (filenames[0], True) not in _SETUP_CACHE
+    assert (filenames[-1], True) in _SETUP_CACHE
 
 
 def test_emoticon():
@@ -210,6 +317,19 @@ def test_words_and_emoticons():
     assert score < 0
 
 
+def test_shared_setup():
+    afinn = Afinn(emoticons=True)
+    other = Afinn(emoticons=True)
+    assert other._pattern is afinn._pattern
+
+    # Setting up one instance again does not change other instances
+    afinn.setup_from_file(join(afinn.data_dir(), 'AFINN-emoticon-8.txt'),
+                          word_boundary=False)
+    assert afinn.score('bad') == 0
+    assert other.score('bad') < 0
+    assert Afinn(emoticons=True).score('bad') < 0
+
+
 def test_emoticon_upper_case():
     afinn = Afinn()
     afinn.setup_from_file(join(afinn.data_dir(), 'AFINN-emoticon-8.txt'),